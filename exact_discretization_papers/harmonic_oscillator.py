@@ -7,10 +7,19 @@ Generates real-time data stream: timestamp, position, frequency
 Using exact discretization: x_{n+1} - 2cos(ωε)x_n + x_{n-1} = 0
 """
 
+import math
+import os
+import sys
 import numpy as np
 import time
-import json
-import matplotlib.pyplot as plt
+
+# Without a display the figure is only saved, so skip GUI backend initialization
+HAS_DISPLAY = sys.platform in ('darwin', 'win32') or bool(os.environ.get('DISPLAY') or os.environ.get('WAYLAND_DISPLAY'))
+
+
+def analytical_position(t, x0, v0, omega, phi):
+    """Continuous solution x(t) = x₀cos(ωt + φ) + (v₀/ω)sin(ωt + φ)"""
+    return x0 * np.cos(omega * t + phi) + (v0 / omega) * np.sin(omega * t + phi)
 
 
 class SKAHarmonicOscillator:
@@ -31,9 +40,21 @@ class SKAHarmonicOscillator:
         self.x0 = x0
         self.v0 = v0
         
+        # Constant recurrence coefficient 2cos(ωε), computed once
+        self._two_cos_we = 2.0 * math.cos(omega * epsilon)
+        
+        # Analytical solution in amplitude/phase form:
+        # x₀cos(ωt + φ) + (v₀/ω)sin(ωt + φ) = A cos(ωt + φ_eff)
+        self._amplitude = math.hypot(x0, v0 / omega)
+        self._phi_eff = phi - math.atan2(v0 / omega, x0)
+        
+        self.reset()
+    
+    def reset(self):
+        """Restart the oscillator from its initial conditions"""
         # Initialize using analytical solution with phase
-        self.x_prev = x0 * np.cos(phi) + (v0 / omega) * np.sin(phi)  # x_{n-1} at t=0
-        self.x_curr = x0 * np.cos(omega * epsilon + phi) + (v0 / omega) * np.sin(omega * epsilon + phi)  # x_n at t=ε
+        self.x_prev = self._amplitude * math.cos(self._phi_eff)  # x_{n-1} at t=0
+        self.x_curr = self._amplitude * math.cos(self.omega * self.epsilon + self._phi_eff)  # x_n at t=ε
         
         self.step_count = 1
         self.start_time = time.time()
@@ -46,11 +67,10 @@ class SKAHarmonicOscillator:
         Note: position represents x_n computed from x_{n-1} and x_{n-2}
         """
         # Exact discretization formula: x_{n+1} - 2cos(ωε)x_n + x_{n-1} = 0
-        x_next = 2 * np.cos(self.omega * self.epsilon) * self.x_curr - self.x_prev
+        x_next = self._two_cos_we * self.x_curr - self.x_prev
         
         # Update state FIRST
-        self.x_prev = self.x_curr
-        self.x_curr = x_next
+        self.x_prev, self.x_curr = self.x_curr, x_next
         self.step_count += 1
         
         # Generate output data using current position (after update)
@@ -68,10 +88,23 @@ class SKAHarmonicOscillator:
             num_steps: Generate this many data points
         """
         if duration is not None:
-            end_time = time.time() + duration
-            while time.time() < end_time:
+            # Real-time simulation: step n is due at start + n*ε on the
+            # monotonic clock, so time spent in step() does not accumulate.
+            # The run ends after duration seconds of elapsed time, even if a
+            # slow consumer has left steps undelivered
+            start = time.monotonic_ns()
+            step_ns = round(self.epsilon * 1e9)
+            end = start + round(duration * 1e9)
+            n = 0
+            while True:
+                target = start + n * step_ns
+                now = time.monotonic_ns()
+                if target >= end or now >= end:
+                    break
+                if now < target:
+                    time.sleep((target - now) * 1e-9)
                 yield self.step()
-                time.sleep(self.epsilon)  # Real-time simulation
+                n += 1
         
         elif num_steps is not None:
             for _ in range(num_steps):
@@ -85,6 +118,13 @@ class SKAHarmonicOscillator:
 
 def main():
     """Generate SKA test data"""
+    # Imported here so that importing SKAHarmonicOscillator for streaming stays light
+    import json
+    import matplotlib
+    if not HAS_DISPLAY:
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    
     print("SKA Harmonic Oscillator Data Generator")
     print("Exact discretization: x_{n+1} - 2cos(ωε)x_n + x_{n-1} = 0")
     print("=" * 50)
@@ -109,24 +149,30 @@ def main():
     print("Format: timestamp, position, frequency")
     print("-" * 40)
     
-    data_points = []
+    # Preallocated columns (one contiguous array per field)
+    num_points = 1000
+    timestamps = np.empty(num_points)
+    positions = np.empty(num_points)  # x_n (discrete position)
+    frequencies = np.empty(num_points)
+    
+    # Console output is collected and written once after generation
+    lines = []
     
     # Generate 1000 data points
-    for i, (timestamp, position, frequency) in enumerate(oscillator.generate_stream(num_steps=1000)):
-        print(f"{timestamp:.6f}, {position:.6f}, {frequency:.3f}")
+    for i, (timestamp, position, frequency) in enumerate(oscillator.generate_stream(num_steps=num_points)):
+        lines.append("%.6f, %.6f, %.3f" % (timestamp, position, frequency))
         
-        data_points.append({
-            "step": i,
-            "timestamp": timestamp,
-            "position": position,  # x_n (discrete position)
-            "frequency": frequency
-        })
+        timestamps[i] = timestamp
+        positions[i] = position
+        frequencies[i] = frequency
         
         # Show progress
         if (i + 1) % 100 == 0:
-            print(f"--- Generated {i + 1} points ---")
+            lines.append(f"--- Generated {i + 1} points ---")
     
-    # Export to JSON for SKA framework
+    sys.stdout.write("\n".join(lines) + "\n")
+    
+    # Export to JSON for SKA framework (column-oriented: one list per field)
     output_data = {
         "metadata": {
             "omega": omega,
@@ -134,28 +180,31 @@ def main():
             "initial_position": x0,
             "initial_velocity": v0,
             "phase": phi,
-            "total_points": len(data_points),
-            "discretization": "exact_ciesliński"
+            "total_points": num_points,
+            "discretization": "exact_ciesliński",
+            "layout": "columnar"  # data holds one list per field, not one record per step
         },
-        "data": data_points
+        "data": {
+            "step": list(range(num_points)),
+            "timestamp": timestamps.tolist(),
+            "position": positions.tolist(),
+            "frequency": frequencies.tolist()
+        }
     }
     
     filename = f"ska_harmonic_data_{int(time.time())}.json"
     with open(filename, 'w') as f:
-        json.dump(output_data, f, indent=2)
+        json.dump(output_data, f)
     
     print(f"\nData exported to: {filename}")
     
     # Plot the data
-    timestamps = [point["timestamp"] for point in data_points]
-    positions = [point["position"] for point in data_points]
-    
     # Convert timestamps to relative time (seconds from start)
     start_timestamp = timestamps[0]
-    relative_times = [(ts - start_timestamp) for ts in timestamps]
+    relative_times = timestamps - start_timestamp
     
     # Create discrete time steps
-    discrete_times = [i * epsilon for i in range(len(positions))]
+    discrete_times = np.arange(len(positions)) * epsilon
     
     plt.figure(figsize=(12, 6))
 
@@ -170,8 +219,8 @@ def main():
     )
 
     # Plot analytical solution with phase
-    t_analytical = np.linspace(0, max(discrete_times), 1000)
-    x_analytical = oscillator.x0 * np.cos(oscillator.omega * t_analytical + oscillator.phi) + (oscillator.v0 / oscillator.omega) * np.sin(oscillator.omega * t_analytical + oscillator.phi)
+    t_analytical = np.linspace(0, discrete_times[-1], 1000)
+    x_analytical = analytical_position(t_analytical, oscillator.x0, oscillator.v0, oscillator.omega, oscillator.phi)
     plt.plot(
         t_analytical,
         x_analytical,
@@ -211,7 +260,8 @@ def main():
 
     plt.tight_layout()
     plt.savefig('harmonic_oscillator.png', dpi=300)  # High-quality output
-    plt.show()
+    if HAS_DISPLAY:
+        plt.show()
 
     print("Ready for SKA framework!")
 
@@ -222,10 +272,19 @@ def real_time_demo():
     
     oscillator = SKAHarmonicOscillator(omega=2.0, epsilon=0.05, phi=np.pi/6)
     
+    # Lines are written in blocks of 256, or at least every 100 ms
+    lines = []
+    last_flush = time.time()
     try:
         for timestamp, position, frequency in oscillator.generate_stream():
-            print(f"{timestamp:.6f}, {position:.6f}, {frequency:.3f}")
+            lines.append("%.6f, %.6f, %.3f\n" % (timestamp, position, frequency))
+            if len(lines) == 256 or timestamp - last_flush >= 0.1:
+                sys.stdout.write("".join(lines))
+                sys.stdout.flush()
+                lines.clear()
+                last_flush = timestamp
     except KeyboardInterrupt:
+        sys.stdout.write("".join(lines))
         print("\nStream stopped.")
 
 
@@ -7,78 +7,404 @@ Using exact discretization: x_{n+1} - 2cos(ωε)x_n + x_{n-1} = 0
 Version: 2025-07-17-User-Fixed
 """
 
+import asyncio
+import math
+import sys
 import numpy as np
 import time
-from typing import Generator, Tuple
+from functools import lru_cache
+from typing import AsyncIterator, Iterator, NamedTuple, Optional, Tuple
+
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+    prange = range
+
+def _advance(x: float, y: float, cos_we: float, sin_we: float, out: np.ndarray):
+    # Fills out with the next out.size positions and returns the final (x, y)
+    for i in range(out.size):
+        x, y = cos_we * x - sin_we * y, sin_we * x + cos_we * y
+        out[i] = x
+    return x, y
+
+def _advance_timed(x: float, y: float, cos_we: float, sin_we: float, t0: float, first: float,
+                   epsilon: float, timestamps: np.ndarray, out: np.ndarray):
+    # _advance that also writes the nominal timestamps t0 + (first + i)*ε in the same pass
+    for i in range(out.size):
+        x, y = cos_we * x - sin_we * y, sin_we * x + cos_we * y
+        out[i] = x
+        timestamps[i] = t0 + (first + i) * epsilon
+    return x, y
+
+def _advance_many(x: np.ndarray, y: np.ndarray, cos_we: np.ndarray, sin_we: np.ndarray,
+                  out: np.ndarray):
+    # Fills out (num_steps, K) with the rotation step of _advance, advancing x and y in
+    # place. The parallel loop runs over blocks of oscillators; within a block each row
+    # segment is written contiguously, so the inner loop vectorizes and threads share
+    # no cache lines
+    num_steps, k_total = out.shape
+    block = 1024
+    for start in prange((k_total + block - 1) // block):
+        lo = start * block
+        hi = min(lo + block, k_total)
+        for n in range(num_steps):
+            for k in range(lo, hi):
+                x_next = cos_we[k] * x[k] - sin_we[k] * y[k]
+                y[k] = sin_we[k] * x[k] + cos_we[k] * y[k]
+                x[k] = x_next
+                out[n, k] = x_next
+
+if NUMBA_AVAILABLE:
+    # Explicit signature: compiled eagerly at import (and cached on disk),
+    # so the first batch does not pay for type inference and compilation
+    # The recurrence state is always float64; out may be float64 or float32.
+    # No fastmath: each step depends on the previous one, so there is nothing to
+    # reorder, and contracting into FMAs would make batches differ from next_position
+    _advance = njit(['UniTuple(f8, 2)(f8, f8, f8, f8, f8[::1])',
+                     'UniTuple(f8, 2)(f8, f8, f8, f8, f4[::1])'],
+                    cache=True, boundscheck=False)(_advance)
+    _advance_timed = njit(['UniTuple(f8, 2)(f8, f8, f8, f8, f8, f8, f8, f8[::1], f8[::1])',
+                           'UniTuple(f8, 2)(f8, f8, f8, f8, f8, f8, f8, f8[::1], f4[::1])'],
+                          cache=True, boundscheck=False)(_advance_timed)
+    # Same for the ensemble kernel: its inner loop has no reduction and vectorizes anyway
+    _advance_many = njit('void(f8[::1], f8[::1], f8[::1], f8[::1], f8[:, ::1])', parallel=True,
+                         cache=True, boundscheck=False)(_advance_many)
+
+@lru_cache(maxsize=128)
+def _rotation_coefficients(omega: float, epsilon: float) -> Tuple[float, float, float]:
+    # cos(ωε), sin(ωε), tan(ωε/2), shared by streams with the same (ω, ε)
+    theta = omega * epsilon
+    return math.cos(theta), math.sin(theta), math.tan(0.5 * theta)
+
+# Waits shorter than this are spun out on perf_counter_ns: time.sleep can
+# overshoot by a scheduler tick, which is comparable to the wait itself.
+# Longer waits just sleep, so millisecond-scale streams do not hold the GIL
+_SPIN_NS = 1_000_000
+
+def _sleep_until(deadline_ns: int) -> None:
+    remaining = deadline_ns - time.perf_counter_ns()
+    if remaining >= _SPIN_NS:
+        time.sleep(remaining * 1e-9)
+        return
+    while time.perf_counter_ns() < deadline_ns:
+        pass
+
+def _amp_phase(omega: float, epsilon: float, x0: float, v0: float,
+               phi: float) -> Tuple[float, float, float]:
+    # Position at t=0 and amplitude/phase of the stream trajectory: a stream
+    # starts from x_{-1} = x_0, so x_n = x_0 cos(nωε + ωε/2) / cos(ωε/2)
+    x_start = x0 * math.cos(phi) + (v0 / omega) * math.sin(phi)
+    phi_eff = 0.5 * omega * epsilon
+    return x_start, x_start / math.cos(phi_eff), phi_eff
+
+class OscillatorState(NamedTuple):
+    x_prev: float
+    x_curr: float
+    step_count: int
+    current_time: float
+    # Fixed between resets; cached on the stream as one tuple
+    omega: float
+    epsilon: float
+    phi: float
+    start_time: float
 
 class HarmonicOscillatorStream:
+    __slots__ = ('omega', 'epsilon', 'x0', 'v0', 'phi', 'x_prev', 'x_curr',
+                 'step_count', 'start_time', '_cos_we', '_sin_we', '_tan_half_we', '_y',
+                 '_fixed_state', '_x_start', '_amplitude', '_phi_eff', '_t0_ns', '_epsilon_ns')
+
     def __init__(self, omega: float = 1.0, epsilon: float = 0.01, 
                  x0: float = 1.0, v0: float = 0.0, phi: float = 0.0):
-        try:
-            if omega == 0:
-                raise ValueError("Angular frequency omega cannot be zero.")
-            if epsilon <= 0:
-                raise ValueError("Time step epsilon must be positive.")
-            
-            self.omega = omega
-            self.epsilon = epsilon
-            self.x0 = x0
-            self.v0 = v0
-            self.phi = phi
-            
-            # Initialize positions at t=0
-            self.x_prev = x0 * np.cos(phi) + (v0 / omega) * np.sin(phi)
-            self.x_curr = self.x_prev
-            self.step_count = 0
-            self.start_time = time.time()
-        except Exception as e:
-            print(f"Error initializing HarmonicOscillatorStream: {e}")
-            raise
+        if omega == 0:
+            raise ValueError("Angular frequency omega cannot be zero.")
+        if epsilon <= 0:
+            raise ValueError("Time step epsilon must be positive.")
+        
+        self.omega = omega
+        self.epsilon = epsilon
+        self.x0 = x0
+        self.v0 = v0
+        self.phi = phi
+        self._cos_we, self._sin_we, self._tan_half_we = _rotation_coefficients(omega, epsilon)
+        
+        self._x_start, self._amplitude, self._phi_eff = _amp_phase(omega, epsilon, x0, v0, phi)
+        self._epsilon_ns = round(epsilon * 1e9)
+        self.reset()
+    
+    def reset(self) -> None:
+        # Initialize positions at t=0; everything else was computed in __init__
+        self.x_prev = self.x_curr = self._x_start
+        # Companion coordinate y_n = (x_{n-1} - cos(ωε) x_n) / sin(ωε); with
+        # x_{-1} = x_0 this is x_0 tan(ωε/2)
+        self._y = self.x_curr * self._tan_half_we
+        self.step_count = 0
+        self.start_time = time.time()
+        self._t0_ns = time.perf_counter_ns()
+        self._fixed_state = (self.omega, self.epsilon, self.phi, self.start_time)
     
     def next_position(self) -> float:
-        try:
-            x_next = 2 * np.cos(self.omega * self.epsilon) * self.x_curr - self.x_prev
-            self.x_prev = self.x_curr
-            self.x_curr = x_next
-            self.step_count += 1
-            return x_next
-        except Exception as e:
-            print(f"Error computing next position: {e}")
-            raise
+        # Rotation form of x_{n+1} = 2cos(ωε)x_n - x_{n-1}: (x, y) is rotated by ωε.
+        # Same sequence in exact arithmetic, but cos(ωε) and sin(ωε) are kept
+        # separately, so long runs keep their phase when ωε is small
+        x, y = self.x_curr, self._y
+        x_next = self._cos_we * x - self._sin_we * y
+        self._y = self._sin_we * x + self._cos_we * y
+        self.x_prev, self.x_curr = x, x_next
+        self.step_count += 1
+        return x_next
     
     def next_position_with_timestamp(self) -> Tuple[float, float]:
-        try:
-            timestamp = time.time()
-            position = self.next_position()
-            return timestamp, position
-        except Exception as e:
-            print(f"Error computing position with timestamp: {e}")
-            raise
-    
-    def get_infinite_stream_with_timestamps(self) -> Generator[Tuple[float, float], None, None]:
-        try:
-            while True:
-                yield self.next_position_with_timestamp()
-        except Exception as e:
-            print(f"Error in infinite stream with timestamps: {e}")
-            raise
+        """Reads the wall clock on every call; prefer get_batch_with_timestamps
+        when evenly spaced timestamps are sufficient"""
+        timestamp = time.time()
+        position = self.next_position()
+        return timestamp, position
     
+    def next_position_with_timestamp_ns(self) -> Tuple[int, float]:
+        """Like next_position_with_timestamp, but the timestamp is the nominal schedule
+        t0 + n*ε in integer perf_counter_ns units (t0 taken at reset), so no clock is read"""
+        timestamp_ns = self._t0_ns + self.step_count * self._epsilon_ns
+        return timestamp_ns, self.next_position()
+
+    def __iter__(self) -> Iterator[float]:
+        return self
+
+    # Bound directly rather than wrapped, saving a call frame per step
+    __next__ = next_position
+
+    def get_infinite_stream_with_timestamps(self) -> Iterator[Tuple[float, float]]:
+        # Callable iterator with a sentinel that never occurs: no generator frame per item
+        return iter(self.next_position_with_timestamp, None)
+
+    def get_real_time_stream(self, duration: Optional[float] = None) -> Iterator[Tuple[float, float]]:
+        """Yields (timestamp, position) paced at one step per ε, forever or for duration seconds.
+        Step n is due at start + n*ε on the monotonic clock, so time spent by the consumer does
+        not accumulate as drift; a consumer that falls behind gets overdue steps without sleeping,
+        until duration seconds have elapsed. Waits under a millisecond are busy-waited for
+        sub-millisecond accuracy."""
+        start = time.perf_counter_ns()
+        end = None if duration is None else start + round(duration * 1e9)
+        step = 0
+        while True:
+            target = start + step * self._epsilon_ns
+            if end is not None and (target >= end or time.perf_counter_ns() >= end):
+                break
+            _sleep_until(target)
+            yield self.next_position_with_timestamp()
+            step += 1
+
+    async def get_real_time_stream_async(self, duration: Optional[float] = None) -> AsyncIterator[Tuple[float, float]]:
+        """Async counterpart of get_real_time_stream for event-loop consumers: waits with
+        asyncio.sleep, so the loop keeps serving other tasks between steps"""
+        start = time.monotonic()
+        end = None if duration is None else start + duration
+        step = 0
+        while True:
+            target = start + step * self.epsilon
+            now = time.monotonic()
+            if end is not None and (target >= end or now >= end):
+                break
+            # A zero-length sleep still yields to the loop when running behind schedule
+            await asyncio.sleep(max(0.0, target - now))
+            yield self.next_position_with_timestamp()
+            step += 1
+
+    def _fill(self, out: np.ndarray, timestamps: Optional[np.ndarray] = None) -> np.ndarray:
+        # Writes the next out.size positions into the 1-D float64/float32 array out (and,
+        # if given, their nominal timestamps start_time + n*ε into timestamps)
+        # and advances the stream state past them
+        num_steps = out.size
+        if num_steps == 0:
+            return out
+        x_prev = self.x_curr
+        if NUMBA_AVAILABLE and timestamps is not None:
+            self.x_curr, self._y = _advance_timed(self.x_curr, self._y, self._cos_we, self._sin_we,
+                                                  self.start_time, float(self.step_count),
+                                                  self.epsilon, timestamps, out)
+        elif NUMBA_AVAILABLE:
+            self.x_curr, self._y = _advance(self.x_curr, self._y,
+                                            self._cos_we, self._sin_we, out)
+        else:
+            if timestamps is not None:
+                np.multiply(np.arange(self.step_count, self.step_count + num_steps,
+                                      dtype=np.float64), self.epsilon, out=timestamps)
+                timestamps += self.start_time
+            # Closed form of the rotation continued from the current state:
+            # x_{k+j} = x_k cos(jωε) - y_k sin(jωε)
+            # Evaluated in place: out plus one scratch buffer, no temporaries
+            theta = self.omega * self.epsilon
+            phase = np.arange(1, num_steps + 1, dtype=np.float64)
+            phase *= theta
+            np.cos(phase, out=out)
+            out *= self.x_curr
+            np.sin(phase, out=phase)
+            phase *= self._y
+            out -= phase
+            # The state is advanced in float64 regardless of the dtype of out
+            last = theta * num_steps
+            cos_last, sin_last = math.cos(last), math.sin(last)
+            self.x_curr, self._y = (self.x_curr * cos_last - self._y * sin_last,
+                                    self.x_curr * sin_last + self._y * cos_last)
+
+        if num_steps == 1:
+            self.x_prev = x_prev
+        elif out.dtype == np.float64:
+            self.x_prev = float(out[-2])
+        else:
+            # out[-2] is rounded; step the float64 state back by one rotation instead
+            self.x_prev = self._cos_we * self.x_curr + self._sin_we * self._y
+        self.step_count += num_steps
+        return out
+
+    @staticmethod
+    def _batch_array(num_steps: int, dtype, out: Optional[np.ndarray]) -> np.ndarray:
+        # Allocates a batch array, or checks that a caller-supplied one can be filled
+        if out is None:
+            dtype = np.dtype(dtype)
+            if dtype not in (np.float64, np.float32):
+                raise ValueError("Batch dtype must be float64 or float32.")
+            return np.empty(max(num_steps, 0), dtype=dtype)
+        if out.shape != (max(num_steps, 0),):
+            raise ValueError(f"Output array must have shape ({max(num_steps, 0)},), got {out.shape}.")
+        if (out.dtype not in (np.float64, np.float32) or not out.flags.c_contiguous
+                or not out.flags.writeable):
+            raise ValueError("Output array must be a writeable, contiguous float64 or float32 array.")
+        return out
+
+    def get_batch(self, num_steps: int, dtype=np.float64,
+                  out: Optional[np.ndarray] = None) -> np.ndarray:
+        """Positions for the next num_steps steps. float32 halves the output size; the
+        recurrence itself stays float64. Pass out to fill a preallocated array instead
+        (its dtype then takes precedence), e.g. once per epoch of a training loop."""
+        return self._fill(self._batch_array(num_steps, dtype, out))
+
+    def get_batch_with_timestamps(self, num_steps: int, dtype=np.float64,
+                                  out_ts: Optional[np.ndarray] = None,
+                                  out_pos: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """(timestamps, positions) for the next num_steps steps, optionally written into
+        out_ts/out_pos. Timestamps follow the nominal schedule start_time + n*ε instead of
+        sampling the clock once per step, and are always float64."""
+        if out_ts is not None and out_ts.dtype != np.float64:
+            raise ValueError("Timestamp array must be float64.")
+        if out_ts is not None and out_pos is not None and np.shares_memory(out_ts, out_pos):
+            raise ValueError("Timestamp and position arrays must not overlap.")
+        timestamps = self._batch_array(num_steps, np.float64, out_ts)
+        positions = self._fill(self._batch_array(num_steps, dtype, out_pos), timestamps)
+        return timestamps, positions
+
+    def get_position_chunks(self, chunk_size: int = 4096, num_chunks: Optional[int] = None,
+                            reuse_buffer: bool = False) -> Iterator[np.ndarray]:
+        """Yields consecutive chunks of chunk_size positions, forever or num_chunks times,
+        e.g. `for chunk in stream.get_position_chunks(4096): learner.process_batch(chunk)`.
+        With reuse_buffer=True every chunk is written into the same array, so no memory is
+        allocated per chunk; each chunk is then only valid until the next one is requested."""
+        buffer = np.empty(max(chunk_size, 0)) if reuse_buffer else None
+        i = 0
+        while num_chunks is None or i < num_chunks:
+            yield self._fill(buffer) if reuse_buffer else self.get_batch(chunk_size)
+            i += 1
+
+    def position_at(self, n: int) -> float:
+        """Position after n steps from the initial state, in O(1) and without advancing the stream"""
+        return self._amplitude * math.cos(self.omega * self.epsilon * n + self._phi_eff)
+
+    def positions_at(self, indices) -> np.ndarray:
+        """Vectorized position_at for an array of step indices"""
+        phase = self.omega * self.epsilon * np.asarray(indices, dtype=np.float64) + self._phi_eff
+        return self._amplitude * np.cos(phase)
+
     @property
-    def current_state(self) -> dict:
-        try:
-            return {
-                'x_prev': self.x_prev,
-                'x_curr': self.x_curr,
-                'step_count': self.step_count,
-                'omega': self.omega,
-                'epsilon': self.epsilon,
-                'phi': self.phi,
-                'start_time': self.start_time,
-                'current_time': time.time()
-            }
-        except Exception as e:
-            print(f"Error getting current state: {e}")
-            raise
+    def current_state(self) -> OscillatorState:
+        return OscillatorState._make((self.x_prev, self.x_curr, self.step_count, time.time())
+                                     + self._fixed_state)
+
+class MultiHarmonicOscillatorStream:
+    """K independent oscillators advanced together, state stored as arrays of shape (K,).
+    Scalar parameters are broadcast; column k follows the same trajectory as
+    HarmonicOscillatorStream with the k-th parameters."""
+    __slots__ = ('omega', 'epsilon', 'x0', 'v0', 'phi', 'x_prev', 'x_curr',
+                 'step_count', 'start_time', '_cos_we', '_sin_we', '_y')
+
+    def __init__(self, omegas, epsilons=0.01, x0s=1.0, v0s=0.0, phis=0.0):
+        # All-scalar parameters give a single oscillator (K=1)
+        omega, epsilon, x0, v0, phi = np.atleast_1d(*np.broadcast_arrays(
+            *(np.asarray(p, dtype=np.float64) for p in (omegas, epsilons, x0s, v0s, phis))))
+        if omega.ndim != 1:
+            raise ValueError("Oscillator parameters must be scalars or 1-D sequences.")
+        if np.any(omega == 0):
+            raise ValueError("Angular frequency omega cannot be zero.")
+        if np.any(epsilon <= 0):
+            raise ValueError("Time step epsilon must be positive.")
+
+        self.omega = omega.copy()
+        self.epsilon = epsilon.copy()
+        self.x0 = x0.copy()
+        self.v0 = v0.copy()
+        self.phi = phi.copy()
+
+        # Initialize positions at t=0
+        self.x_prev = self.x0 * np.cos(self.phi) + (self.v0 / self.omega) * np.sin(self.phi)
+        self.x_curr = self.x_prev.copy()
+        # Rotation form, as in HarmonicOscillatorStream: y_0 = x_0 tan(ωε/2)
+        theta = self.omega * self.epsilon
+        self._cos_we = np.cos(theta)
+        self._sin_we = np.sin(theta)
+        self._y = self.x_curr * np.tan(0.5 * theta)
+        self.step_count = 0
+        self.start_time = time.time()
+
+    @property
+    def num_oscillators(self) -> int:
+        return self.x_curr.size
+
+    def next_positions(self) -> np.ndarray:
+        x, y = self.x_curr, self._y
+        x_next = self._cos_we * x - self._sin_we * y
+        self._y = self._sin_we * x + self._cos_we * y
+        self.x_prev, self.x_curr = x, x_next
+        self.step_count += 1
+        return x_next
+
+    def get_batch(self, num_steps: int) -> np.ndarray:
+        """Positions for the next num_steps steps as an array of shape (num_steps, K)"""
+        out = np.empty((max(num_steps, 0), self.x_curr.size))
+        if num_steps <= 0:
+            return out
+        x_last = self.x_curr
+        # Fresh state arrays, advanced in place: the old ones may be held by
+        # callers of next_positions
+        x, y = self.x_curr.copy(), self._y.copy()
+        c, s = self._cos_we, self._sin_we
+        if NUMBA_AVAILABLE:
+            _advance_many(x, y, c, s, out)
+        else:
+            scratch = np.empty_like(x)
+            for row in out:
+                np.multiply(c, x, out=row)
+                np.multiply(s, y, out=scratch)
+                row -= scratch
+                np.multiply(s, x, out=scratch)
+                y *= c
+                y += scratch
+                x[:] = row
+        self.x_prev = out[-2].copy() if num_steps > 1 else x_last
+        self.x_curr, self._y = x, y
+        self.step_count += num_steps
+        return out
+
+def create_test_stream(num_steps: int = 1000, omega: float = 1.0, epsilon: float = 0.01,
+                       x0: float = 1.0, v0: float = 0.0, phi: float = 0.0) -> np.ndarray:
+    """First num_steps positions of a fresh HarmonicOscillatorStream, without building one"""
+    if omega == 0:
+        raise ValueError("Angular frequency omega cannot be zero.")
+    if epsilon <= 0:
+        raise ValueError("Time step epsilon must be positive.")
+
+    _, amplitude, phi_eff = _amp_phase(omega, epsilon, x0, v0, phi)
+    n = np.arange(1, num_steps + 1, dtype=np.float64)
+    return amplitude * np.cos((omega * epsilon) * n + phi_eff)
 
 def continuous_stream():
     try:
@@ -108,35 +434,56 @@ def continuous_stream():
         step = 0
         start_time = time.time()
         last_position = stream.x_curr
+        # Per-step lines are preformatted as bytes and written straight to the
+        # binary stdout buffer in blocks; a replaced stdout without one (io.StringIO,
+        # IDLE) gets the same blocks decoded to text
+        stdout = getattr(sys.stdout, "buffer", None)
+        if stdout is not None:
+            write = stdout.write
+        else:
+            stdout = sys.stdout
+            write = lambda block: stdout.write(block.decode())
+        buf = bytearray()
+        last_flush = start_time
+        sys.stdout.flush()
         
         while True:
             # Calculate exact target time for this step
             target_time = start_time + (step * epsilon)
             
-            # Wait until we reach the exact target time
-            current_time = time.time()
-            if current_time < target_time:
-                time.sleep(target_time - current_time)
-            
-            # Take timestamp at exact target time
+            # Wait until we reach the exact target time; the clock is only
+            # read again after an actual sleep, so a stream running behind
+            # schedule pays for a single time.time() call per step
             timestamp = time.time()
+            if timestamp < target_time:
+                time.sleep(target_time - timestamp)
+                timestamp = time.time()
             position = stream.next_position()
             physical_time = timestamp - start_time
             
-            print(f"{step:6d}, {timestamp:.6f}, {physical_time:11.6f}, {position:12.8f}")
+            buf += b"%6d, %.6f, %11.6f, %12.8f\n" % (step, timestamp, physical_time, position)
             if step == 0:
-                print(f"Debug: physical_time = {physical_time:.6f}, step * epsilon = {step * epsilon:.6f}")
+                buf += b"Debug: physical_time = %.6f, step * epsilon = %.6f\n" % (physical_time, step * epsilon)
             
             if step % 1000 == 0 and step > 0:
                 position_change = abs(position - last_position)
                 timing_error = abs(physical_time - (step * epsilon))
-                print(f"Debug: Position change over {step} steps: {position_change:.8f}")
-                print(f"Debug: Timing error (should be {step * epsilon:.3f}s): {timing_error:.6f}s")
+                buf += b"Debug: Position change over %d steps: %.8f\n" % (step, position_change)
+                buf += b"Debug: Timing error (should be %.3fs): %.6fs\n" % (step * epsilon, timing_error)
                 last_position = position
             
+            # Flush every 256 steps, or after 100 ms so slow streams still show output promptly
+            if step % 256 == 0 or timestamp - last_flush >= 0.1:
+                write(buf)
+                stdout.flush()
+                buf.clear()
+                last_flush = timestamp
+            
             step += 1
             
     except KeyboardInterrupt:
+        write(buf)
+        stdout.flush()
         elapsed_time = time.time() - start_time
         cycles_completed = elapsed_time * omega / (2 * np.pi)
         print(f"\nStopped after {step} steps")